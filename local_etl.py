@@ -1,7 +1,7 @@
 from strava_api.load_env import load_env_variables
 from strava_api.get_access_token import get_access_token
 from strava_api.fetch_activities import fetch_activities
-from strava_api.transform_data import transform_data
+from strava_api.transform_data import ACTIVITY_SCHEMA, transform_data
 from strava_api.load_data import load_data
 
 import polars as pl
@@ -20,8 +20,8 @@ def main():
         # Step 3: Fetch activities
         activities = fetch_activities(access_token)
 
-        # Step 4: Convert activities to Polars DataFrame
-        df = pl.DataFrame(activities)
+        # Step 4: Convert activities to Polars DataFrame with a fixed schema (no inference)
+        df = pl.from_dicts(activities, schema=ACTIVITY_SCHEMA, infer_schema_length=0)
 
         # Step 5: Clean and transform data
         df_transformed = transform_data(df)
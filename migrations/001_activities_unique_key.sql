@@ -0,0 +1,6 @@
+-- Unique key targeted by the webhook's upsert (on_conflict=athlete_id,activity_id).
+-- PostgREST rejects the upsert with error 42P10 until this index exists, so apply
+-- it before deploying webhook_server.py. The name matches the index load_data
+-- creates, so running both is harmless.
+CREATE UNIQUE INDEX IF NOT EXISTS activities_athlete_id_activity_id_key
+    ON activities (athlete_id, activity_id);
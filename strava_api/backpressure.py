@@ -0,0 +1,87 @@
+# backpressure.py
+import asyncio
+import time
+from collections import deque
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit for calls to an external service.
+
+    The limit grows additively while calls succeed within the target latency and
+    is cut multiplicatively when a call fails or is slow, so bursts back off
+    instead of piling more requests onto a service that is already struggling.
+    """
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 32,
+                 target_latency: float = 1.0, increase: float = 0.5, decrease: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._waiters = deque()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def _acquire(self) -> None:
+        while not self._has_capacity():
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Hand a wake-up that arrived with the cancellation on to the next waiter
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def _release(self, succeeded: bool) -> None:
+        self.in_flight -= 1
+        if succeeded:
+            self.limit = min(self.maximum, self.limit + self.increase)
+        else:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+        self._wake()
+
+    async def run(self, awaitable, is_failure=None):
+        """
+        Awaits `awaitable` once a slot is free and adjusts the limit from the outcome.
+
+        Parameters:
+            awaitable: Coroutine performing the call.
+            is_failure: Optional predicate on the result, for calls that report
+                failures (such as rate limiting) by return value instead of raising.
+
+        Returns:
+            The result of `awaitable`.
+        """
+        try:
+            await self._acquire()
+        except BaseException:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+
+        start = time.monotonic()
+        succeeded = False
+        try:
+            result = await awaitable
+            succeeded = (
+                time.monotonic() - start <= self.target_latency
+                and not (is_failure and is_failure(result))
+            )
+            return result
+        finally:
+            self._release(succeeded)
@@ -1,20 +1,70 @@
 # fetch_activities.py
-import requests
+import asyncio
+import aiohttp
 
-def fetch_activities(access_token: str, per_page: int = 200, page: int = 1):
+from strava_api.http import SESSION
+
+ACTIVITIES_URL = "https://www.strava.com/api/v3/athlete/activities"
+
+# Strava allows 100 requests per 15 minutes, so only a few pages are in flight at once
+MAX_CONCURRENT_PAGES = 5
+
+async def _fetch_page(session: aiohttp.ClientSession, per_page: int, page: int) -> list:
     """
-    Fetches activities from Strava using the provided access token.
+    Fetches a single page of activities.
     """
-    activities_url = f"https://www.strava.com/api/v3/athlete/activities?access_token={access_token}"
-    
-    payload = {}
-    headers = {}
     params = {'per_page': per_page, 'page': page}
-    
-    try:
-        response = requests.get(activities_url, headers=headers, data=payload, params=params)
+    async with session.get(ACTIVITIES_URL, params=params) as response:
         response.raise_for_status()  # This will raise an error if the response status code is not 200
-        activities = response.json()
+        return await response.json()
+
+async def fetch_all_activities(access_token: str, max_pages: int = 10, per_page: int = 200) -> list:
+    """
+    Fetches up to `max_pages` pages of activities from Strava concurrently.
+
+    Page 1 is requested on its own, since most histories fit on it; only when it
+    is full are the remaining pages requested in windows of MAX_CONCURRENT_PAGES.
+    Fetching stops after the first page that comes back short, since that is the
+    end of the history.
+
+    Parameters:
+        access_token (str): The Strava API access token.
+        max_pages (int): The maximum number of pages to request.
+        per_page (int): The number of activities per page (Strava caps this at 200).
+
+    Returns:
+        list: The activities from all fetched pages, in page order.
+    """
+    activities = []
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_PAGES, ttl_dns_cache=300)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        # Don't spend rate-limit budget on empty pages when one page holds everything
+        activities.extend(await _fetch_page(session, per_page, 1))
+        if len(activities) < per_page:
+            return activities
+
+        for first_page in range(2, max_pages + 1, MAX_CONCURRENT_PAGES):
+            pages = range(first_page, min(first_page + MAX_CONCURRENT_PAGES, max_pages + 1))
+            results = await asyncio.gather(
+                *(_fetch_page(session, per_page, page) for page in pages)
+            )
+
+            for page_activities in results:
+                activities.extend(page_activities)
+                if len(page_activities) < per_page:
+                    return activities
+
+    return activities
+
+def fetch_activities(access_token: str, per_page: int = 200, max_pages: int = 10):
+    """
+    Fetches activities from Strava using the provided access token.
+    Synchronous wrapper around fetch_all_activities.
+    """
+    try:
+        activities = asyncio.run(fetch_all_activities(access_token, max_pages=max_pages, per_page=per_page))
         
         if not activities:
             print("No activities found.")
@@ -22,7 +72,7 @@ def fetch_activities(access_token: str, per_page: int = 200, page: int = 1):
 
         return activities
         
-    except requests.exceptions.HTTPError as http_err:
+    except aiohttp.ClientResponseError as http_err:
         print(f"HTTP error occurred: {http_err}")
         raise
     except ValueError as val_err:
@@ -32,8 +82,6 @@ def fetch_activities(access_token: str, per_page: int = 200, page: int = 1):
         print(f"Other error occurred: {err}")
         raise
 
-import requests
-
 # Fetch single activity for a given activity ID
 def fetch_single_activity(access_token: str, activity_id: int):
     """
@@ -49,7 +97,7 @@ def fetch_single_activity(access_token: str, activity_id: int):
     url = f"https://www.strava.com/api/v3/activities/{activity_id}"
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    response = requests.get(url, headers=headers)
+    response = SESSION.get(url, headers=headers)
 
     if response.status_code == 200:
         return response.json()  # Return the activity data as a dictionary
@@ -1,24 +1,33 @@
 # get_access_token.py
 import requests
 
-def get_access_token(client_id: str, client_secret: str, refresh_token: str):
+from strava_api.http import SESSION
+
+def refresh_access_token(client_id: str, client_secret: str, refresh_token: str) -> dict:
     """
     Uses the refresh token to get a new access token from Strava API.
+    Returns the full token response, including `access_token`, `expires_at`
+    (epoch seconds) and the `refresh_token` to use next time.
     """
-    token_url = f"https://www.strava.com/oauth/token?client_id={client_id}&client_secret={client_secret}&refresh_token={refresh_token}&grant_type=refresh_token"
+    token_url = "https://www.strava.com/oauth/token"
     
-    payload = {}
+    # Send the credentials in the form body so they never end up in the URL
+    payload = {
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "refresh_token": refresh_token,
+        "grant_type": "refresh_token",
+    }
     headers = {}
     
     try:
         print("Requesting Token...\n")
-        response = requests.post(token_url, headers=headers, data=payload)
+        response = SESSION.post(token_url, headers=headers, data=payload)
         response.raise_for_status()  # This will raise an error if the response status code is not 200
         response_data = response.json()
         
-        access_token = response_data.get('access_token')
         print("Access token received")
-        return access_token
+        return response_data
         
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTP error occurred: {http_err}")  # For example, 401, 404, etc.
@@ -26,3 +35,9 @@ def get_access_token(client_id: str, client_secret: str, refresh_token: str):
     except Exception as err:
         print(f"Other error occurred: {err}")  # Catch other possible exceptions (e.g., connection issues)
         raise
+
+def get_access_token(client_id: str, client_secret: str, refresh_token: str):
+    """
+    Uses the refresh token to get a new access token from Strava API.
+    """
+    return refresh_access_token(client_id, client_secret, refresh_token).get('access_token')
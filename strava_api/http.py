@@ -0,0 +1,30 @@
+# http.py
+import atexit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Shared session so Strava calls reuse pooled connections instead of opening
+# a new TLS connection per request
+SESSION = requests.Session()
+
+# Connections kept per host; at least the webhook server's concurrent Strava
+# fetches, so busy worker threads never find the pool full
+POOL_MAXSIZE = 20
+
+# Retry transient server errors (honouring Retry-After on 503); once retries
+# run out the last response is returned for the caller to handle. 429 is not
+# retried: Strava sends it when the 15-minute quota is spent, so quick retries
+# would only burn more of the next window
+_retry = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=(500, 502, 503, 504),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=POOL_MAXSIZE, max_retries=_retry)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+atexit.register(SESSION.close)
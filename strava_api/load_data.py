@@ -1,5 +1,10 @@
+import atexit
+import csv
+import functools
+import io
 import logging
-from typing import Optional, Union
+import math
+from typing import Dict, Optional, Union
 import pandas as pd
 import polars as pl
 from sqlalchemy import text, create_engine, inspect
@@ -9,6 +14,11 @@ from urllib.parse import quote_plus
 
 from strava_api.load_env import load_env_variables
 
+try:
+    import adbc_driver_postgresql.dbapi as adbc_postgresql
+except ImportError:  # Optional: without ADBC, Polars frames go through pandas and COPY CSV
+    adbc_postgresql = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -16,23 +26,75 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_engine() -> Engine:
+# Token PostgreSQL's COPY reads back as NULL
+COPY_NULL = r"\N"
+# Rows per COPY statement; each chunk is buffered in memory before it is sent
+COPY_CHUNKSIZE = 50_000
+
+# Column snapshots of existing tables, keyed by (database URL, table name)
+_schema_cache: Dict[tuple, Dict[str, str]] = {}
+
+# Canonical family of each reflected PostgreSQL type, ignoring any (n) suffix
+PG_CANONICAL = {
+    'DOUBLE PRECISION': 'FLOAT',
+    'REAL': 'FLOAT',
+    'FLOAT': 'FLOAT',
+    'INTEGER': 'INTEGER',
+    'BIGINT': 'INTEGER',
+    'SMALLINT': 'INTEGER',
+    'BOOLEAN': 'BOOLEAN',
+    'TEXT': 'TEXT',
+    'VARCHAR': 'TEXT',
+    'CHARACTER VARYING': 'TEXT',
+    'TIMESTAMP WITHOUT TIME ZONE': 'TIMESTAMP',
+    'TIMESTAMP': 'TIMESTAMP',
+    'DATE': 'TIMESTAMP',
+}
+
+# Canonical PostgreSQL types each pandas dtype can be loaded into
+DTYPE_COMPATIBILITY = {
+    'float64': frozenset({'FLOAT'}),
+    'float32': frozenset({'FLOAT'}),
+    'int64': frozenset({'INTEGER', 'FLOAT'}),
+    'int32': frozenset({'INTEGER', 'FLOAT'}),
+    'bool': frozenset({'BOOLEAN'}),
+    'object': frozenset({'TEXT'}),
+    'datetime64[ns]': frozenset({'TIMESTAMP'}),
+    'datetime64[ms]': frozenset({'TIMESTAMP'}),
+}
+
+def get_database_url(scheme: str = "postgresql+psycopg2") -> str:
     """
-    Creates and returns a SQLAlchemy engine using environment variables.
+    Builds the database URL from environment variables.
     
+    Args:
+        scheme: URL scheme; the SQLAlchemy dialect+driver, or plain "postgresql" for libpq
+        
     Returns:
-        SQLAlchemy Engine instance
+        str: database URL
     """
     env_vars = load_env_variables()
     
     # URL encode the password to handle special characters
     encoded_password = quote_plus(env_vars['password'])
     
-    database_url = (
-        f"postgresql+psycopg2://{env_vars['user']}:{encoded_password}"
+    return (
+        f"{scheme}://{env_vars['user']}:{encoded_password}"
         f"@{env_vars['host']}:{env_vars['port']}/{env_vars['dbname']}"
         "?sslmode=require"
     )
+
+@functools.lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """
+    Creates the SQLAlchemy engine from environment variables on first use and
+    returns the same instance afterwards, so its connection pool is reused.
+    
+    Returns:
+        SQLAlchemy Engine instance
+    """
+    env_vars = load_env_variables()
+    database_url = get_database_url()
     
     logger.debug(f"Connecting to database at {env_vars['host']}")
     
@@ -40,9 +102,190 @@ def get_engine() -> Engine:
         database_url,
         pool_size=5,
         max_overflow=10,
-        pool_timeout=30
+        pool_timeout=30,
+        executemany_mode="values_plus_batch",
+        insertmanyvalues_page_size=10000
     )
 
+def _dispose_engine() -> None:
+    """
+    Closes pooled connections at interpreter exit if an engine was ever created.
+    """
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
+
+atexit.register(_dispose_engine)
+
+def _format_value_for_copy(value):
+    """
+    Formats a single value for PostgreSQL's CSV COPY input.
+
+    None and NaN become the COPY NULL token; everything else is written as-is.
+    """
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, float) and math.isnan(value):
+        return COPY_NULL
+    return value
+
+def psql_copy_insert(table, conn, keys, data_iter) -> int:
+    """
+    pandas `to_sql` insertion method that streams rows through COPY FROM STDIN.
+
+    Args:
+        table: pandas SQLTable being written to
+        conn: SQLAlchemy connection
+        keys: list of column names
+        data_iter: iterable of row tuples
+
+    Returns:
+        int: number of rows copied
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows([_format_value_for_copy(value) for value in row] for row in data_iter)
+    buf.seek(0)
+
+    table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+    return _copy_csv(conn, table_name, keys, buf)
+
+def _copy_frame(conn, df: pd.DataFrame, table_name: str) -> int:
+    """
+    Copies a DataFrame into an existing table, COPY_CHUNKSIZE rows per COPY.
+
+    Returns:
+        int: number of rows copied
+    """
+    row_count = 0
+    for start in range(0, len(df), COPY_CHUNKSIZE):
+        buf = io.StringIO()
+        df.iloc[start:start + COPY_CHUNKSIZE].to_csv(buf, index=False, header=False, na_rep=COPY_NULL)
+        buf.seek(0)
+        row_count += _copy_csv(conn, f'"{table_name}"', df.columns, buf)
+    return row_count
+
+def _copy_csv(conn, table_name: str, keys, buf: io.StringIO) -> int:
+    """
+    Runs COPY FROM STDIN for a CSV buffer on the connection's DBAPI cursor.
+    """
+    columns = ', '.join(f'"{key}"' for key in keys)
+    sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+
+    with conn.connection.cursor() as cur:
+        cur.copy_expert(sql, buf)
+        return cur.rowcount
+
+def _unique_index_sql(table_name: str, primary_keys: list) -> str:
+    """
+    SQL ensuring a UNIQUE index on the primary keys, for ON CONFLICT to target.
+    """
+    return (
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_{'_'.join(primary_keys)}_key "
+        f"ON {table_name} ({', '.join(primary_keys)})"
+    )
+
+def _insert_from_staging_sql(table_name: str, staging_table: str, columns, primary_keys: Optional[list]) -> str:
+    """
+    SQL moving staged rows into the target table, skipping existing primary keys.
+    """
+    column_list = ', '.join(f'"{col}"' for col in columns)
+    sql = f"INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {staging_table}"
+    if primary_keys:
+        sql += f" ON CONFLICT ({', '.join(primary_keys)}) DO NOTHING"
+    return sql
+
+def _insert_new_records(conn, df: pd.DataFrame, table_name: str, primary_keys: list) -> int:
+    """
+    Inserts the rows of df whose primary keys are not already in the table.
+
+    The frame is copied into a temporary staging table and moved across with a
+    single INSERT ... ON CONFLICT DO NOTHING, so the database skips existing
+    records itself. Must run inside a transaction; the staging table is
+    dropped on commit.
+
+    Returns:
+        int: number of rows actually inserted
+    """
+    # Create the target table from the frame's columns on first load
+    df.head(0).to_sql(table_name, conn, if_exists="append", index=False)
+
+    conn.execute(text(_unique_index_sql(table_name, primary_keys)))
+
+    staging_table = f"stg_{table_name}"
+    conn.execute(text(
+        f"CREATE TEMP TABLE {staging_table} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+    ))
+    _copy_frame(conn, df, staging_table)
+
+    result = conn.execute(text(
+        _insert_from_staging_sql(table_name, staging_table, df.columns, primary_keys)
+    ))
+    return result.rowcount
+
+def _load_arrow(df: pl.DataFrame, table_name: str, primary_keys: Optional[list]) -> int:
+    """
+    Loads a Polars DataFrame through ADBC, which sends its Arrow buffers with
+    PostgreSQL binary COPY without building Python objects per row.
+
+    Binary COPY needs exact column types, so the frame is ingested into a
+    temporary staging table and moved across with INSERT ... SELECT, letting
+    PostgreSQL cast to the target types. With primary keys, existing records
+    are skipped by ON CONFLICT DO NOTHING.
+
+    Returns:
+        int: number of rows actually inserted
+    """
+    arrow_table = df.to_arrow()
+    staging_table = f"stg_{table_name}"
+
+    with adbc_postgresql.connect(get_database_url("postgresql")) as conn:
+        with conn.cursor() as cur:
+            # Create the target table from the frame's columns on first load
+            cur.adbc_ingest(table_name, arrow_table.slice(0, 0), mode="create_append")
+            if primary_keys:
+                cur.execute(_unique_index_sql(table_name, primary_keys))
+
+            cur.adbc_ingest(staging_table, arrow_table, mode="create", temporary=True)
+            cur.execute(_insert_from_staging_sql(table_name, staging_table, df.columns, primary_keys))
+            row_count = cur.rowcount
+            cur.execute(f"DROP TABLE {staging_table}")
+        conn.commit()
+
+    return row_count
+
+def get_table_columns(engine: Engine, table_name: str) -> Optional[Dict[str, str]]:
+    """
+    Returns the column name to PostgreSQL type mapping of an existing table.
+
+    The snapshot is cached per database and table; call clear_schema_cache()
+    after altering a table. Missing tables are not cached, so a table created
+    later is picked up on the next call.
+    
+    Args:
+        engine: SQLAlchemy engine
+        table_name: name of the table
+        
+    Returns:
+        dict of column types, or None if the table does not exist
+    """
+    key = (str(engine.url), table_name)
+    if key not in _schema_cache:
+        inspector = inspect(engine)
+        if not inspector.has_table(table_name):
+            return None
+
+        _schema_cache[key] = {
+            col['name']: str(col['type']).upper() 
+            for col in inspector.get_columns(table_name)
+        }
+    return _schema_cache[key]
+
+def clear_schema_cache() -> None:
+    """
+    Drops all cached table schemas.
+    """
+    _schema_cache.clear()
+
 def validate_table_schema(engine: Engine, df: pd.DataFrame, table_name: str) -> bool:
     """
     Validate that DataFrame schema matches existing table schema.
@@ -55,47 +298,32 @@ def validate_table_schema(engine: Engine, df: pd.DataFrame, table_name: str) ->
     Returns:
         bool: True if schema matches or table doesn't exist
     """
-    inspector = inspect(engine)
+    existing_columns = get_table_columns(engine, table_name)
     
-    if not inspector.has_table(table_name):
+    if existing_columns is None:
         logger.info(f"Table {table_name} does not exist - will be created")
         return True
-
-    existing_columns = {
-        col['name']: str(col['type']).upper() 
-        for col in inspector.get_columns(table_name)
-    }
     
-    # Map pandas dtypes to PostgreSQL types
-    type_mapping = {
-        'float64': {'REAL', 'DOUBLE PRECISION', 'FLOAT'},
-        'int64': {'INTEGER', 'BIGINT'},
-        'bool': {'BOOLEAN'},
-        'object': {'TEXT', 'VARCHAR', 'CHARACTER VARYING'},
-        'datetime64[ns]': {'TIMESTAMP WITHOUT TIME ZONE', 'TIMESTAMP', 'DATE'},
-        'datetime64[ms]': {'TIMESTAMP WITHOUT TIME ZONE', 'TIMESTAMP', 'DATE'},
+    existing_canonical = {
+        col: PG_CANONICAL.get(pg_type.split('(')[0].strip(), pg_type)
+        for col, pg_type in existing_columns.items()
     }
     
     mismatched_columns = []
     for col, dtype in df.dtypes.items():
-        if col in existing_columns:
-            dtype_name = dtype.name
-            pg_type = existing_columns[col]
-            
-            # Check if the PostgreSQL type is compatible with the pandas dtype
-            compatible_types = type_mapping.get(dtype_name, set())
-            
-            # Special handling for FLOAT(n) format
-            if 'FLOAT' in pg_type or 'REAL' in pg_type:
-                compatible_types.add('FLOAT')
-                if dtype_name != 'float64' and not (dtype_name.startswith('float') or dtype_name.startswith('int')):
-                    mismatched_columns.append(f"{col}: {dtype_name} vs {pg_type}")
-            # Special handling for INTEGER
-            elif 'INTEGER' in pg_type and dtype_name == 'float64':
-                # Convert float columns to integer if they're going into INTEGER columns
-                df[col] = df[col].round().astype('int64')
-            elif pg_type not in compatible_types:
-                mismatched_columns.append(f"{col}: {dtype_name} vs {pg_type}")
+        canonical_type = existing_canonical.get(col)
+        if canonical_type is None:
+            continue
+
+        dtype_name = dtype.name
+        if canonical_type in DTYPE_COMPATIBILITY.get(dtype_name, frozenset()):
+            continue
+
+        if canonical_type == 'INTEGER' and dtype_name == 'float64':
+            # Convert float columns to integer if they're going into INTEGER columns
+            df[col] = df[col].round().astype('int64')
+        else:
+            mismatched_columns.append(f"{col}: {dtype_name} vs {existing_columns[col]}")
     
     if mismatched_columns:
         logger.error(f"Schema mismatch for columns: {', '.join(mismatched_columns)}")
@@ -119,20 +347,24 @@ def load_data(df: Union[pd.DataFrame, pl.DataFrame], table_name: str = "activiti
     if table_name == 'activities' and primary_keys is None:
         primary_keys = ['athlete_id', 'activity_id']
 
-    # Convert to pandas DataFrame if necessary
+    # Convert to pandas DataFrame if necessary; with ADBC, Polars frames stay as Arrow
     if isinstance(df, pl.DataFrame):
         try:
-            df = df.to_pandas()
-            # Cast specific columns to match PostgreSQL schema
+            # Cast specific columns to match PostgreSQL schema while still in Polars,
+            # where casts to the existing dtype are free, so conversion is the only copy
             if table_name == 'activities':
-                df['calories'] = df['calories'].round().astype('int64')
-                # Convert date to datetime64[ns] and normalize to midnight
-                df['date'] = pd.to_datetime(df['date']).dt.normalize()
                 float_cols = ['distance', 'moving_time', 'elapsed_time', 'average_speed', 
                             'max_speed', 'average_cadence', 'average_heartrate', 
                             'max_heartrate', 'elev_high', 'elev_low']
-                df[float_cols] = df[float_cols].astype('float64')
-            logger.info("Successfully converted Polars DataFrame to pandas DataFrame with proper types")
+                df = df.with_columns(
+                    pl.col('calories').round(0).cast(pl.Int64),
+                    # Date becomes datetime64[ns] at midnight on the pandas side
+                    pl.col('date').cast(pl.Datetime('ns')),
+                    pl.col(float_cols).cast(pl.Float64),
+                )
+            if adbc_postgresql is None:
+                df = df.to_pandas()
+                logger.info("Successfully converted Polars DataFrame to pandas DataFrame with proper types")
         except Exception as e:
             logger.error(f"Failed to convert Polars DataFrame to pandas: {str(e)}")
             return False
@@ -146,54 +378,32 @@ def load_data(df: Union[pd.DataFrame, pl.DataFrame], table_name: str = "activiti
 
     engine = get_engine()
     try:
-        # Validate schema before loading
-        if not validate_table_schema(engine, df, table_name):
+        # Validate schema before loading; a Polars frame is checked via its empty pandas equivalent
+        schema_df = df if isinstance(df, pd.DataFrame) else df.head(0).to_pandas()
+        if not validate_table_schema(engine, schema_df, table_name):
             raise ValueError("Schema validation failed")
             
-        # If we have primary keys defined, check for existing records
-        if primary_keys:
-            with engine.connect() as conn:
-                # Create a temporary table with just the primary keys
-                temp_df = df[primary_keys].copy()
-                temp_table = f"temp_{table_name}_check"
-                
-                # Load primary keys to temporary table
-                temp_df.to_sql(temp_table, conn, if_exists='replace', index=False)
-                
-                # Query to find records that don't exist in the main table
-                query = f"""
-                    SELECT t.* FROM {temp_table} t
-                    LEFT JOIN {table_name} m ON {' AND '.join(f't.{pk} = m.{pk}' for pk in primary_keys)}
-                    WHERE {' OR '.join(f'm.{pk} IS NULL' for pk in primary_keys)}
-                """
-                
-                # Get the new records' primary keys
-                new_records = pd.read_sql(query, conn)
-                
-                # Drop temporary table
-                conn.execute(text(f"DROP TABLE IF EXISTS {temp_table}"))
-                conn.commit()
-                
-                if len(new_records) == 0:
-                    logger.info("No new records to insert to the database")
-                    return True  # Exit cleanly with a success status
-                
-                # Filter the original DataFrame to only include new records
-                df = df.merge(new_records, on=primary_keys, how='inner')
-                
-                logger.info(f"Found {len(df)} new records to insert")
-
-        # Perform the data load
-        df.to_sql(
-            table_name,
-            engine,
-            if_exists="append",
-            index=False,
-            method="multi",
-            chunksize=1000
-        )
-        
-        row_count = len(df)
+        if isinstance(df, pl.DataFrame):
+            row_count = _load_arrow(df, table_name, primary_keys)
+        else:
+            with engine.begin() as conn:
+                if primary_keys:
+                    # Let the database skip records that already exist
+                    row_count = _insert_new_records(conn, df, table_name, primary_keys)
+                else:
+                    row_count = df.to_sql(
+                        table_name,
+                        conn,
+                        if_exists="append",
+                        index=False,
+                        method=psql_copy_insert,
+                        chunksize=COPY_CHUNKSIZE
+                    )
+
+        if row_count == 0:
+            logger.info("No new records to insert to the database")
+            return True  # Exit cleanly with a success status
+
         logger.info(f"Successfully loaded {row_count} rows into {table_name}")
         return True
         
@@ -203,8 +413,6 @@ def load_data(df: Union[pd.DataFrame, pl.DataFrame], table_name: str = "activiti
     except Exception as e:
         logger.error(f"Unexpected error during load: {str(e)}")
         return False
-    finally:
-        engine.dispose()
 
 def test_connection() -> bool:
     """
@@ -222,8 +430,6 @@ def test_connection() -> bool:
     except SQLAlchemyError as e:
         logger.error(f"Database connection test failed: {str(e)}")
         return False
-    finally:
-        engine.dispose()
 
 if __name__ == "__main__":
     # Test the connection when running this script directly
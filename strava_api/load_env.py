@@ -1,4 +1,5 @@
 import os
+import functools
 import logging
 from typing import Dict
 from dotenv import load_dotenv
@@ -10,10 +11,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=1)
 def load_env_variables(env_file: str = ".env") -> Dict[str, str]:
     """
     Loads environment variables from a .env file.
     Returns a dictionary containing both Strava API and database connection variables.
+    The result is cached, so the file is only read and validated once per process.
     
     Args:
         env_file: Path to the environment file
@@ -14,22 +14,25 @@ def save_to_csv(df: pl.DataFrame, filename: str):
             col_type = df[col].dtype
             
             if isinstance(col_type, pl.List):
-                # Convert list columns to string using list comprehension and join
+                # Convert list columns to comma-separated strings
                 processed_cols.append(
-                    pl.col(col).map_elements(lambda x: ','.join(str(i) for i in x) if x is not None else '').alias(col)
+                    pl.col(col).list.eval(pl.element().cast(pl.Utf8)).list.join(",").fill_null("").alias(col)
                 )
             elif isinstance(col_type, pl.Struct):
-                # Convert struct columns to string representation
-                processed_cols.append(pl.col(col).cast(str).alias(col))
+                # Convert struct columns to their JSON representation; json_encode
+                # writes a null struct as "null", so blank it like a null list
+                processed_cols.append(
+                    pl.when(pl.col(col).is_null())
+                    .then(pl.lit(""))
+                    .otherwise(pl.col(col).struct.json_encode())
+                    .alias(col)
+                )
             else:
                 # Keep other columns as is
                 processed_cols.append(pl.col(col))
         
-        # Create new DataFrame with processed columns
-        processed_df = df.select(processed_cols)
-        
-        # Write to CSV
-        processed_df.write_csv(filename)
+        # The frame is already in memory, so write the processed columns directly
+        df.select(processed_cols).write_csv(filename)
         print(f"Data saved successfully to {filename}")
         
     except Exception as e:
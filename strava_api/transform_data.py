@@ -1,6 +1,44 @@
+import math
+from datetime import date
+
 import polars as pl
-import pandas as pd
-from datetime import datetime
+
+# Dtypes of the Strava activity fields the pipeline reads; any other payload
+# fields are dropped when a frame is built with this schema
+ACTIVITY_SCHEMA = {
+    "id": pl.Int64,
+    "athlete": pl.Struct({"id": pl.Int64}),
+    "name": pl.Utf8,
+    "distance": pl.Float64,
+    "moving_time": pl.Int64,
+    "elapsed_time": pl.Int64,
+    "type": pl.Utf8,
+    "sport_type": pl.Utf8,
+    "start_date_local": pl.Utf8,
+    "average_speed": pl.Float64,
+    "max_speed": pl.Float64,
+    "average_cadence": pl.Float64,
+    "kilojoules": pl.Float64,
+    "has_heartrate": pl.Boolean,
+    "average_heartrate": pl.Float64,
+    "max_heartrate": pl.Float64,
+    "elev_high": pl.Float64,
+    "elev_low": pl.Float64,
+}
+
+# Numeric payload fields where a missing value is treated as zero
+ZERO_FILL_COLUMNS = [
+    "distance",
+    "moving_time",
+    "elapsed_time",
+    "average_speed",
+    "max_speed",
+    "average_cadence",
+    "elev_high",
+    "elev_low",
+    "average_heartrate",
+    "max_heartrate",
+]
 
 def convert_pace(speed_m_per_s):
     """
@@ -24,84 +62,164 @@ def convert_pace(speed_m_per_s):
     except (ValueError, ZeroDivisionError):
         return "N/A"
 
-def transform_data(df: pd.DataFrame) -> pd.DataFrame:
+def pace_expr(speed: pl.Expr) -> pl.Expr:
+    """
+    Vectorized equivalent of convert_pace for a column of speeds (m/s).
+    """
+    # Null out non-positive speeds so the integer casts never see inf
+    minutes_per_km = pl.when(speed > 0).then(1000.0 / speed / 60.0)
+    minutes = minutes_per_km.cast(pl.Int64)
+    seconds = ((minutes_per_km - minutes) * 60).round(0).cast(pl.Int64)
+
+    # Carry a rounded-up 60 seconds over into the minutes
+    carry = seconds == 60
+    minutes = pl.when(carry).then(minutes + 1).otherwise(minutes)
+    seconds = pl.when(carry).then(0).otherwise(seconds)
+
+    return (
+        pl.format("{}:{}/km", minutes, seconds.cast(pl.Utf8).str.zfill(2))
+        .fill_null(pl.lit("N/A"))
+    )
+
+# Per-column transforms, built once at import and reused by every call
+_TRANSFORM_EXPRS = [
+    # Extract athlete_id from the "athlete" struct field
+    pl.col("athlete").struct.field("id").alias("athlete_id"),
+    # Unit conversions multiply by the reciprocal explicitly: Polars rewrites a
+    # division by a scalar that way only on multi-row frames, so the rounded
+    # result would otherwise depend on the frame's length
+    (pl.col("distance") * (1 / 1000)).round(2).alias("distance"),
+    (pl.col("moving_time") * (1 / 60)).round(2).alias("moving_time"),
+    (pl.col("elapsed_time") * (1 / 60)).round(2).alias("elapsed_time"),
+    # Only the calendar date is kept, so parse the leading YYYY-MM-DD directly
+    pl.col("start_date_local")
+      .str.slice(0, 10)
+      .str.to_date("%Y-%m-%d", strict=False)
+      .alias("date"),
+    pl.col("kilojoules").fill_null(0).mul(0.239).round(0).alias("calories"),
+    pl.col("average_speed").round(2).alias("average_speed"),
+    pace_expr(pl.col("average_speed").round(2)).alias("pace"),
+    pl.col("max_speed").round(2).alias("max_speed"),
+    pl.col("average_cadence").round(2).alias("average_cadence"),
+    pl.col("elev_high").round(2).alias("elev_high"),
+    pl.col("elev_low").round(2).alias("elev_low"),
+    pl.col("has_heartrate").cast(pl.Boolean).fill_null(False).alias("has_heartrate"),
+    pl.col("average_heartrate").round(1).alias("average_heartrate"),
+    pl.col("max_heartrate").round(1).alias("max_heartrate"),
+    pl.col("id").cast(pl.Int64).alias("activity_id"),
+    pl.coalesce(pl.col("sport_type"), pl.col("type")).alias("sport"),
+]
+
+_SELECT_COLS = [
+    "athlete_id",
+    "activity_id",
+    "name",
+    "distance",
+    "moving_time",
+    "elapsed_time",
+    "sport",
+    "date",
+    "average_speed",
+    "max_speed",
+    "average_cadence",
+    "calories",
+    "has_heartrate",
+    "average_heartrate",
+    "max_heartrate",
+    "elev_high",
+    "elev_low",
+    "pace",
+]
+
+def transform_data(pl_df: pl.DataFrame) -> pl.DataFrame:
     """
     Transforms the Strava activity data with null handling and type conversions.
 
     Parameters:
-        df (pd.DataFrame): Raw Strava activity data.
+        pl_df (pl.DataFrame): Raw Strava activity data.
     
     Returns:
-        pd.DataFrame: Transformed activity data.
+        pl.DataFrame: Transformed activity data.
     """
-    # Convert pandas DataFrame to a Polars DataFrame
-    pl_df = pl.from_pandas(df)
-
-    # Extract athlete_id from the "athlete" struct field
-    try:
-        athlete_id_expr = pl.col("athlete").struct.field("id").alias("athlete_id")
-    except Exception as e:
-        print(f"Error extracting athlete_id: {e}")
-        athlete_id_expr = pl.lit(None).alias("athlete_id")
+    lf = pl_df.lazy()
 
-    # Define calories expression using kilojoules if available
-    if "kilojoules" in pl_df.columns:
-        calories_expr = pl.col("kilojoules").fill_null(0).mul(0.239).round(0).alias("calories")
-    else:
-        calories_expr = pl.lit(0).alias("calories")
+    # Activities without power data have no kilojoules; a null column yields 0 calories
+    if "kilojoules" not in pl_df.columns:
+        lf = lf.with_columns(pl.lit(None, dtype=pl.Float64).alias("kilojoules"))
 
     try:
+        # Build a single lazy plan so projection pushdown drops the raw
+        # payload fields that are never selected before any work is done
         transformed_df = (
-            pl_df
-            .with_columns([
-                athlete_id_expr,
-                (pl.col("distance").fill_null(0) / 1000).round(2).alias("distance"),
-                (pl.col("moving_time").fill_null(0) / 60).round(2).alias("moving_time"),
-                (pl.col("elapsed_time").fill_null(0) / 60).round(2).alias("elapsed_time"),
-                # Updated date parsing to handle UTC timezone
-                pl.col("start_date_local")
-                  .str.strptime(pl.Datetime, format="%Y-%m-%dT%H:%M:%SZ", strict=False)
-                  .cast(pl.Date)
-                  .alias("date"),
-                calories_expr,
-                pl.col("average_speed").fill_null(0).round(2).alias("average_speed"),
-                pl.col("max_speed").fill_null(0).round(2).alias("max_speed"),
-                pl.col("average_cadence").fill_null(0).round(2).alias("average_cadence"),
-                pl.col("elev_high").fill_null(0).round(2).alias("elev_high"),
-                pl.col("elev_low").fill_null(0).round(2).alias("elev_low"),
-                pl.col("has_heartrate").cast(pl.Boolean).fill_null(False).alias("has_heartrate"),
-                pl.col("average_heartrate").fill_null(0).round(1).alias("average_heartrate"),
-                pl.col("max_heartrate").fill_null(0).round(1).alias("max_heartrate"),
-                pl.col("id").cast(pl.Int64).alias("activity_id"),
-                pl.coalesce(pl.col("sport_type"), pl.col("type")).alias("sport")
-            ])
-            .with_columns([
-                pl.col("average_speed").map_elements(convert_pace, return_dtype=pl.Utf8).alias("pace")
-            ])
-            .select([
-                "athlete_id",
-                "activity_id",
-                "name",
-                "distance",
-                "moving_time",
-                "elapsed_time",
-                "sport",
-                "date",
-                "average_speed",
-                "max_speed",
-                "average_cadence",
-                "calories",
-                "has_heartrate",
-                "average_heartrate",
-                "max_heartrate",
-                "elev_high",
-                "elev_low",
-                "pace"
-            ])
+            lf
+            .with_columns(pl.col(ZERO_FILL_COLUMNS).fill_null(0))
+            .with_columns(_TRANSFORM_EXPRS)
+            .select(_SELECT_COLS)
+            .collect()
         )
     except Exception as e:
         print(f"Error transforming data: {e}")
         raise
 
-    # Convert back to pandas DataFrame
-    return transformed_df.to_pandas()
+    return transformed_df
+
+def _round(value: float, decimals: int) -> float:
+    """
+    Rounds half away from zero, matching Polars' Expr.round (Python's round() is half-even).
+    """
+    scaled = abs(value) * 10 ** decimals
+    rounded = math.floor(scaled)
+    if scaled - rounded >= 0.5:
+        rounded += 1
+    return math.copysign(rounded, value) / 10 ** decimals
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value[:10])
+    except (TypeError, ValueError):
+        return None
+
+def transform_record(row: dict) -> dict:
+    """
+    Transforms a single raw Strava activity with the same rules as transform_data,
+    using plain Python so one-off records (e.g. webhook events) skip building a DataFrame.
+
+    Parameters:
+        row (dict): Raw Strava activity, as returned by the API.
+
+    Returns:
+        dict: Transformed activity, keyed like the columns of transform_data's output.
+    """
+    def number(field, cast):
+        value = row.get(field)
+        return cast(value) if value is not None else cast(0)
+
+    average_speed = _round(number("average_speed", float), 2)
+    sport = row.get("sport_type")
+
+    try:
+        return {
+            "athlete_id": (row.get("athlete") or {}).get("id"),
+            "activity_id": int(row["id"]),
+            "name": row.get("name"),
+            # Same reciprocal multiplications as _TRANSFORM_EXPRS, so the last bit
+            # (and therefore the rounding) agrees with transform_data
+            "distance": _round(number("distance", float) * (1 / 1000), 2),
+            "moving_time": _round(number("moving_time", int) * (1 / 60), 2),
+            "elapsed_time": _round(number("elapsed_time", int) * (1 / 60), 2),
+            "sport": sport if sport is not None else row.get("type"),
+            "date": _parse_date(row.get("start_date_local")),
+            "average_speed": average_speed,
+            "max_speed": _round(number("max_speed", float), 2),
+            "average_cadence": _round(number("average_cadence", float), 2),
+            "calories": _round(number("kilojoules", float) * 0.239, 0),
+            "has_heartrate": bool(row.get("has_heartrate") or False),
+            "average_heartrate": _round(number("average_heartrate", float), 1),
+            "max_heartrate": _round(number("max_heartrate", float), 1),
+            "elev_high": _round(number("elev_high", float), 2),
+            "elev_low": _round(number("elev_low", float), 2),
+            "pace": convert_pace(average_speed) if average_speed > 0 else "N/A",
+        }
+    except Exception as e:
+        print(f"Error transforming record: {e}")
+        raise
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from strava_api.backpressure import AIMDLimiter
+
+async def _ok():
+    return "ok"
+
+async def _fail():
+    raise RuntimeError("rate limited")
+
+# Test the limit grows on fast successes and halves on failures
+def test_aimd_limiter_adjusts_limit():
+    limiter = AIMDLimiter(initial=4, minimum=1, maximum=5, target_latency=1.0)
+
+    async def scenario():
+        assert await limiter.run(_ok()) == "ok"
+        assert limiter.limit == 4.5
+        with pytest.raises(RuntimeError):
+            await limiter.run(_fail())
+        assert limiter.limit == 2.25
+        await limiter.run(_ok(), is_failure=lambda result: result == "ok")
+        assert limiter.limit == 1.125
+        for _ in range(20):
+            await limiter.run(_ok())
+        assert limiter.limit == 5  # Capped at the maximum
+
+    asyncio.run(scenario())
+    assert limiter.in_flight == 0
+
+# Test concurrent calls never exceed the current limit
+def test_aimd_limiter_bounds_concurrency():
+    limiter = AIMDLimiter(initial=2, maximum=2)
+    active = []
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        active.append(None)
+        peak = max(peak, len(active))
+        await asyncio.sleep(0.01)
+        active.pop()
+
+    async def scenario():
+        await asyncio.gather(*(limiter.run(call()) for _ in range(10)))
+
+    asyncio.run(scenario())
+    assert peak == 2
@@ -0,0 +1,18 @@
+import polars as pl
+from strava_api.save_data import save_to_csv
+
+# Test nested columns are flattened and nulls are written as empty fields
+def test_save_to_csv_flattens_nested_columns(tmp_path):
+    df = pl.DataFrame({
+        "activity_id": [1, 2],
+        "tags": [["run", "race"], None],
+        "athlete": [{"id": 12345}, None],
+    })
+    filename = tmp_path / "activities.csv"
+
+    save_to_csv(df, str(filename))
+
+    lines = filename.read_text().splitlines()
+    assert lines[0] == "activity_id,tags,athlete"
+    assert lines[1] == '1,"run,race","{""id"":12345}"'
+    assert lines[2] == '2,"",""'  # Null list and null struct are both empty
@@ -1,6 +1,13 @@
 import pytest
 import polars as pl
-from strava_api.transform_data import convert_pace, transform_data
+from strava_api.transform_data import (
+    ACTIVITY_SCHEMA,
+    ZERO_FILL_COLUMNS,
+    convert_pace,
+    pace_expr,
+    transform_data,
+    transform_record,
+)
 
 # Test convert_pace function
 @pytest.mark.parametrize("speed, expected_pace", [
@@ -12,6 +19,13 @@ from strava_api.transform_data import convert_pace, transform_data
 def test_convert_pace(speed, expected_pace):
     assert convert_pace(speed) == expected_pace
 
+# Test pace_expr matches the scalar convert_pace
+def test_pace_expr_matches_convert_pace():
+    speeds = [3.33, 2.78, 5.0, 3.3367, 0.5, 0.0, None]  # 3.3367 rounds up to 60s
+    df = pl.DataFrame({"speed": speeds}, schema={"speed": pl.Float64})
+    paces = df.select(pace_expr(pl.col("speed")).alias("pace"))["pace"].to_list()
+    assert paces == [convert_pace(speed) for speed in speeds]
+
 # Test transform_data function
 def test_transform_data():
     # Create a mock DataFrame
@@ -23,6 +37,7 @@ def test_transform_data():
         "moving_time": [1500],  # 25 min
         "elapsed_time": [1600],  # 26.67 min
         "type": ["Run"],
+        "sport_type": ["Run"],
         "start_date_local": ["2023-05-15T08:30:00Z"],
         "average_speed": [3.33],  # 5:00/km pace
         "max_speed": [5.5],
@@ -40,7 +55,7 @@ def test_transform_data():
 
     # Assert correct transformations
     assert df_transformed["athlete_id"][0] == 12345
-    assert df_transformed["workout_id"][0] == 1001
+    assert df_transformed["activity_id"][0] == 1001
     assert df_transformed["name"][0] == "Morning Run"
     assert df_transformed["distance"][0] == 5.00  # Converted to km, rounded to 2 decimals
     assert df_transformed["moving_time"][0] == 25.00  # Converted to min
@@ -56,4 +71,127 @@ def test_transform_data():
     assert df_transformed["max_heartrate"][0] == 180.2  # Rounded to 1 decimal
     assert df_transformed["elev_high"][0] == 100.57
     assert df_transformed["elev_low"][0] == 50.23
-    assert df_transformed["pace"][0] == "5:00/km"  # Correct pace formatting
\ No newline at end of file
+    assert df_transformed["pace"][0] == "5:00/km"  # Correct pace formatting
+
+# Test transform_data null handling
+def test_transform_data_fills_nulls():
+    df = pl.DataFrame({
+        "athlete": [{"id": 12345}],
+        "id": [1002],
+        "name": ["Evening Walk"],
+        "distance": [None],
+        "moving_time": [None],
+        "elapsed_time": [None],
+        "type": ["Walk"],
+        "sport_type": [None],
+        "start_date_local": ["2023-05-16T18:00:00Z"],
+        "average_speed": [None],
+        "max_speed": [None],
+        "average_cadence": [None],
+        "has_heartrate": [None],
+        "average_heartrate": [None],
+        "max_heartrate": [None],
+        "elev_high": [None],
+        "elev_low": [None],
+    }, schema_overrides={col: pl.Float64 for col in ZERO_FILL_COLUMNS})
+
+    df_transformed = transform_data(df)
+
+    for col in ZERO_FILL_COLUMNS:
+        assert df_transformed[col][0] == 0
+    assert df_transformed["calories"][0] == 0  # No kilojoules in the payload
+    assert df_transformed["has_heartrate"][0] == False
+    assert df_transformed["sport"][0] == "Walk"  # Falls back to type
+    assert df_transformed["pace"][0] == "N/A"
+
+# Test transform_data on a raw API payload built with ACTIVITY_SCHEMA
+def test_transform_data_from_activity_schema():
+    activity = {
+        "resource_state": 2,
+        "athlete": {"id": 12345, "resource_state": 1},
+        "id": 1003,
+        "name": "Lunch Ride",
+        "distance": 20000,  # Integer in the payload, Float64 in the schema
+        "moving_time": 3000,
+        "elapsed_time": 3300,
+        "type": "Ride",
+        "sport_type": "GravelRide",
+        "start_date_local": "2023-05-17T12:00:00Z",
+        "average_speed": 6.667,
+        "max_speed": 12.1,
+        "has_heartrate": False,
+        "map": {"id": "a1003", "summary_polyline": ""},
+    }
+    df = pl.from_dicts([activity], schema=ACTIVITY_SCHEMA, infer_schema_length=0)
+
+    assert df.columns == list(ACTIVITY_SCHEMA)  # Unknown fields are dropped
+
+    df_transformed = transform_data(df)
+
+    assert df_transformed["athlete_id"][0] == 12345
+    assert df_transformed["distance"][0] == 20.00
+    assert df_transformed["sport"][0] == "GravelRide"
+    assert df_transformed["calories"][0] == 0  # No kilojoules in the payload
+
+# Test transform_record matches the DataFrame path row for row
+@pytest.mark.parametrize("activity", [
+    {
+        "athlete": {"id": 12345},
+        "id": 1004,
+        "name": "Tempo Run",
+        "distance": 10015.4,
+        "moving_time": 2705,
+        "elapsed_time": 2790,
+        "type": "Run",
+        "sport_type": "Run",
+        "start_date_local": "2023-05-18T07:15:00Z",
+        "average_speed": 3.3367,
+        "max_speed": 4.125,
+        "average_cadence": 88.345,
+        "kilojoules": 612.5,
+        "has_heartrate": True,
+        "average_heartrate": 158.25,
+        "max_heartrate": 176.05,
+        "elev_high": 42.015,
+        "elev_low": 12.655,
+    },
+    {
+        "athlete": {"id": 12345},
+        "id": 1005,
+        "name": "Yoga",
+        "moving_time": 1800,
+        "elapsed_time": 1800,
+        "type": "Yoga",
+        "start_date_local": "2023-05-18T19:00:00Z",
+    },
+])
+def test_transform_record_matches_transform_data(activity):
+    df = pl.from_dicts([activity], schema=ACTIVITY_SCHEMA, infer_schema_length=0)
+    assert transform_record(activity) == transform_data(df).to_dicts()[0]
+
+# Test transform_record matches transform_data on one-row and multi-row frames
+# for distances whose rounding depends on how the division is carried out
+def test_transform_record_matches_transform_data_on_rounding_edges():
+    activities = [
+        {
+            "athlete": {"id": 12345},
+            "id": 2000 + i,
+            "name": "Edge Run",
+            "distance": distance,
+            "moving_time": 2705,
+            "elapsed_time": 2790,
+            "type": "Run",
+            "start_date_local": "2023-05-19T07:00:00Z",
+            "average_speed": 3.33,
+        }
+        for i, distance in enumerate([1005, 36105, 39675, 38035])
+    ]
+    expected = [transform_record(activity) for activity in activities]
+
+    df = pl.from_dicts(activities, schema=ACTIVITY_SCHEMA, infer_schema_length=0)
+    assert transform_data(df).to_dicts() == expected
+    for activity, record in zip(activities, expected):
+        single = pl.from_dicts([activity], schema=ACTIVITY_SCHEMA, infer_schema_length=0)
+        assert transform_data(single).to_dicts() == [record]
+
+    assert [record["distance"] for record in expected] == [1.01, 36.11, 39.68, 38.04]
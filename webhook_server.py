@@ -1,15 +1,42 @@
-from fastapi import FastAPI, Request, HTTPException, Query
+import asyncio
+import atexit
+import hmac
+import logging
+import logging.handlers
+import queue
+import re
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, Request, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 import os
-import pandas as pd
+import time
+import orjson
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from strava_api.get_access_token import get_access_token
+import httpx
+from postgrest import AsyncPostgrestClient
+from pydantic import BaseModel
+from supabase import AsyncClient, AsyncClientOptions
+from strava_api.backpressure import AIMDLimiter
+from strava_api.get_access_token import refresh_access_token
 from strava_api.fetch_activities import fetch_single_activity
-from strava_api.transform_data import transform_data
-from typing import Dict, Any, Optional
-from datetime import datetime
+from strava_api.http import POOL_MAXSIZE
+from strava_api.transform_data import transform_record
+from typing import Dict, Any, Literal, Optional
 import uvicorn
 
+# Log records are queued from the event loop and written out by a background thread
+_log_queue = queue.Queue(-1)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger("webhook_server")
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+
 # Load environment variables
 load_dotenv()
 
@@ -18,27 +45,229 @@ CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 REFRESH_TOKEN = os.getenv("REFRESH_TOKEN")
 
+# Token Strava echoes back when the webhook subscription is verified
+VERIFY_TOKEN = os.getenv("STRAVA_VERIFY_TOKEN", "my_verification_token").encode()
+
+# Refresh the Strava token this many seconds before it expires
+TOKEN_EXPIRY_MARGIN = 60
+
+class _TokenCache:
+    """Strava access token shared by all handlers until shortly before it expires."""
+    token: Optional[str] = None
+    expires_at: float = 0.0
+    # Strava may rotate the refresh token, so keep the latest one it handed out
+    refresh_token: Optional[str] = REFRESH_TOKEN
+    lock = asyncio.Lock()
+
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Fail at startup rather than on the first webhook, so missing credentials never
+# reach Strava's OAuth endpoint and spend rate-limit budget on doomed requests
+_REQUIRED_ENV = {
+    "CLIENT_ID": CLIENT_ID,
+    "CLIENT_SECRET": CLIENT_SECRET,
+    "REFRESH_TOKEN": REFRESH_TOKEN,
+    "SUPABASE_URL": SUPABASE_URL,
+    "SUPABASE_KEY": SUPABASE_KEY,
+}
+_missing = [name for name, value in _REQUIRED_ENV.items() if not value]
+if _missing:
+    raise Exception(f"Missing environment variables: {', '.join(_missing)}")
+# str.isdigit alone also accepts non-ASCII digits, which Strava rejects
+if not (CLIENT_ID.isascii() and CLIENT_ID.isdigit()):
+    raise Exception("CLIENT_ID must be the numeric Strava client ID")
+
+# Events processed at once, so a burst of webhooks cannot swamp Strava or Supabase
+MAX_CONCURRENT_EVENTS = 20
+_process_semaphore = asyncio.Semaphore(MAX_CONCURRENT_EVENTS)
+
+# Adaptive limits in front of each external service; they back off on errors and slow calls
+# Strava fetches run in worker threads on the shared requests pool, so never exceed its size
+strava_limiter = AIMDLimiter(
+    initial=8, maximum=min(MAX_CONCURRENT_EVENTS, POOL_MAXSIZE), target_latency=2.0
+)
+
+# Hard ceiling on concurrent Supabase requests, sized to the project's connection budget
+try:
+    SUPABASE_MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "10"))
+except ValueError:
+    SUPABASE_MAX_CONCURRENCY = 0
+if SUPABASE_MAX_CONCURRENCY < 1:
+    raise Exception("SUPABASE_MAX_CONCURRENCY must be an integer of at least 1")
+supabase_limiter = AIMDLimiter(
+    initial=min(8, SUPABASE_MAX_CONCURRENCY), maximum=SUPABASE_MAX_CONCURRENCY, target_latency=1.0
+)
+
+async def _db(coro):
+    """Await a Supabase `execute()` call within the Supabase concurrency limit."""
+    return await supabase_limiter.run(coro)
+
+# PostgREST connections, sized from the Supabase concurrency cap: at most
+# SUPABASE_MAX_CONCURRENCY requests are in flight, with headroom to keep
+# twice that many connections alive across the limiter's ramp-ups
+SUPABASE_POOL_LIMITS = httpx.Limits(
+    max_connections=2 * SUPABASE_MAX_CONCURRENCY,
+    max_keepalive_connections=2 * SUPABASE_MAX_CONCURRENCY,
+)
+SUPABASE_TIMEOUT = httpx.Timeout(10, connect=2)
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    """PostgREST client whose HTTP/2 session uses the server's connection pool limits."""
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+            follow_redirects=True,
+            http2=True,
+            limits=SUPABASE_POOL_LIMITS,
+        )
+
+class _PooledSupabaseClient(AsyncClient):
+    """Supabase client that builds its PostgREST client with _PooledPostgrestClient."""
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=SUPABASE_TIMEOUT,
+                               verify=True, proxy=None) -> AsyncPostgrestClient:
+        return _PooledPostgrestClient(
+            rest_url, headers=headers, schema=schema, timeout=timeout, verify=verify, proxy=proxy
+        )
+
+# New activities arriving within this many seconds are inserted in one request
+BATCH_WINDOW = 0.2
+MAX_BATCH_SIZE = 100
+
+# (record, future) pairs waiting for the next batched insert
+_pending: asyncio.Queue = asyncio.Queue()
+
+async def queue_insert(record: Dict[str, Any]) -> bool:
+    """Queue a new activity for the next batched insert; returns False if it already existed."""
+    future = asyncio.get_running_loop().create_future()
+    await _pending.put((record, future))
+    return await future
+
+def _fail_batch(batch: list, error: BaseException) -> None:
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+async def _write_batch(supabase: AsyncClient, batch: list) -> None:
+    try:
+        # The whole batch is normalized in a single orjson call
+        records = to_json_compatible([record for record, _ in batch])
+        # Existing rows are left untouched and only the inserted rows are returned; the
+        # conflict target's unique index comes from migrations/001_activities_unique_key.sql
+        result = await _db(
+            supabase.table('activities').upsert(
+                records, on_conflict="athlete_id,activity_id", ignore_duplicates=True
+            ).execute()
+        )
+        inserted = {row["activity_id"] for row in result.data}
+    except Exception as e:
+        # Fail this batch's callers but leave the batcher running for the next one
+        logger.error("Batched insert of %d activities failed: %s", len(batch), e)
+        if getattr(e, "code", None) == "42P10":
+            logger.error("No unique index on activities (athlete_id, activity_id); "
+                         "apply migrations/001_activities_unique_key.sql")
+        _fail_batch(batch, e)
+        return
+
+    logger.info(
+        "Batch of %d activities: %d inserted, %d already existed",
+        len(batch), len(inserted), len(batch) - len(inserted),
+    )
+    for record, future in batch:
+        if not future.done():
+            future.set_result(record["activity_id"] in inserted)
+
+async def insert_batches(supabase: AsyncClient) -> None:
+    """Coalesce queued activities into one upsert per batch window."""
+    batch = []
+    try:
+        while True:
+            batch = [await _pending.get()]
+            await asyncio.sleep(BATCH_WINDOW)
+            while len(batch) < MAX_BATCH_SIZE and not _pending.empty():
+                batch.append(_pending.get_nowait())
+            await _write_batch(supabase, batch)
+    finally:
+        # On shutdown, release every caller still waiting on an insert
+        while not _pending.empty():
+            batch.append(_pending.get_nowait())
+        _fail_batch(batch, RuntimeError("Webhook server shut down before the activity was inserted"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One async Supabase client per process; its HTTP/2 connection pool is
+    # reused across webhooks and queries no longer block the event loop
+    app.state.supabase = await _PooledSupabaseClient.create(
+        SUPABASE_URL, SUPABASE_KEY, AsyncClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT)
+    )
+    batcher = asyncio.create_task(insert_batches(app.state.supabase))
+    yield
+    batcher.cancel()
+    await asyncio.gather(batcher, return_exceptions=True)
+    await app.state.supabase.postgrest.aclose()
 
 # FastAPI app
-app = FastAPI()
-
-def prepare_for_supabase(data: Dict[str, Any]) -> Dict[str, Any]:
-    """Convert timestamps and other non-serializable types to appropriate format."""
-    processed_data = {}
-    for key, value in data.items():
-        if isinstance(value, pd.Timestamp):
-            processed_data[key] = value.isoformat()
-        elif isinstance(value, datetime):
-            processed_data[key] = value.isoformat()
-        else:
-            processed_data[key] = value
-    return processed_data
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+async def get_cached_token() -> str:
+    """Return a valid Strava access token, refreshing it only when it is about to expire."""
+    async with _TokenCache.lock:
+        if _TokenCache.token is None or time.time() > _TokenCache.expires_at - TOKEN_EXPIRY_MARGIN:
+            token_data = await asyncio.to_thread(
+                refresh_access_token, CLIENT_ID, CLIENT_SECRET, _TokenCache.refresh_token
+            )
+            _TokenCache.token = token_data["access_token"]
+            _TokenCache.expires_at = float(token_data.get("expires_at", 0))
+            _TokenCache.refresh_token = token_data.get("refresh_token", _TokenCache.refresh_token)
+        return _TokenCache.token
+
+# One lock per activity being processed, so duplicate deliveries never race
+_inflight: Dict[int, asyncio.Lock] = {}
+_inflight_waiters: Dict[int, int] = {}
+
+@asynccontextmanager
+async def activity_lock(activity_id: int):
+    """Serialize handling of one activity; the lock is dropped once nobody waits on it."""
+    lock = _inflight.setdefault(activity_id, asyncio.Lock())
+    _inflight_waiters[activity_id] = _inflight_waiters.get(activity_id, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _inflight_waiters[activity_id] -= 1
+        if not _inflight_waiters[activity_id]:
+            del _inflight_waiters[activity_id]
+            del _inflight[activity_id]
+
+_JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+def to_json_compatible(data):
+    """Normalize dates, datetimes and numpy values to JSON types in one orjson pass."""
+    return orjson.loads(orjson.dumps(data, option=_JSON_OPTIONS))
+
+class StravaWebhookEvent(BaseModel):
+    """Activity webhook event as delivered by Strava; fields the pipeline does not use are ignored."""
+    object_type: Literal["activity"]
+    object_id: int
+    owner_id: int
+    aspect_type: Literal["create", "update", "delete"]
+
+# Cheap byte-level test for activity events, run before the payload is parsed
+_ACTIVITY_EVENT = re.compile(rb'"object_type"\s*:\s*"activity"')
+
+_EVENT_MESSAGES = {
+    "create": "New activity detected: %s",
+    "update": "Activity %s updated.",
+    "delete": "Activity %s deleted.",
+}
 
 @app.get("/")
 async def root() -> Dict[str, str]:
@@ -48,126 +277,150 @@ async def root() -> Dict[str, str]:
 async def health_check() -> Dict[str, str]:
     return {"status": "healthy"}
 
+def _pool_connection_counts(session: httpx.AsyncClient):
+    """
+    Open and idle connection counts from httpx's pool, or (None, None) when its
+    private internals (transport pool, httpcore connection API) are not as expected.
+    """
+    try:
+        connections = list(session._transport._pool.connections)
+        return len(connections), sum(connection.is_idle() for connection in connections)
+    except Exception:
+        return None, None
+
+@app.get("/metrics")
+async def metrics() -> Dict[str, Any]:
+    connections, idle = _pool_connection_counts(app.state.supabase.postgrest.session)
+    return {
+        "supabase_pool": {
+            "connections": connections,
+            "idle": idle,
+            "max_connections": SUPABASE_POOL_LIMITS.max_connections,
+            "max_keepalive_connections": SUPABASE_POOL_LIMITS.max_keepalive_connections,
+        },
+        "strava_limiter": {"limit": strava_limiter.limit, "in_flight": strava_limiter.in_flight},
+        "supabase_limiter": {"limit": supabase_limiter.limit, "in_flight": supabase_limiter.in_flight},
+        "pending_inserts": _pending.qsize(),
+        "activities_in_flight": len(_inflight),
+    }
+
 @app.get("/webhook")
 async def verify_webhook(
     hub_mode: str = Query(None, alias="hub.mode"),
     hub_challenge: str = Query(None, alias="hub.challenge"),
     hub_verify_token: str = Query(None, alias="hub.verify_token")
 ) -> Dict[str, str]:
-    if not all([hub_mode, hub_challenge, hub_verify_token]):
+    if not (hub_mode and hub_challenge and hub_verify_token):
         raise HTTPException(status_code=400, detail="Missing required parameters")
     
-    if hub_verify_token == "my_verification_token":
+    # Constant-time comparison so the token cannot be guessed from response timing
+    if hmac.compare_digest(hub_verify_token.encode(), VERIFY_TOKEN):
         return {"hub.challenge": hub_challenge}
     
     raise HTTPException(status_code=403, detail="Invalid verify token")
 
 @app.post("/webhook")
-async def handle_webhook(request: Request) -> Dict[str, str]:
+async def handle_webhook(request: Request, background_tasks: BackgroundTasks) -> Dict[str, str]:
     try:
-        event = await request.json()
-        print("Webhook Data:", event)
+        body = await request.body()
+        # Athlete events (and bodies that are not an activity event at all) are
+        # acknowledged without being parsed; the model below validates the rest
+        if not _ACTIVITY_EVENT.search(body):
+            return {"status": "ignored"}
 
-        if event.get("object_type") == "activity":
-            athlete_id = event.get("owner_id")
-            activity_id = event.get("object_id")
-            aspect_type = event.get("aspect_type")
+        # pydantic-core parses and validates the raw body in a single pass
+        event = StravaWebhookEvent.model_validate_json(body)
+        logger.debug("Webhook data: %s", event)
 
-            if aspect_type == "create":
-                print(f"New activity detected: {activity_id}")
-                await process_new_activity(athlete_id, activity_id)
-            elif aspect_type == "update":
-                print(f"Activity {activity_id} updated.")
-                await process_updated_activity(athlete_id, activity_id)
-            elif aspect_type == "delete":
-                print(f"Activity {activity_id} deleted.")
-                await delete_activity(activity_id)
+        logger.info(_EVENT_MESSAGES[event.aspect_type], event.object_id)
+
+        # Strava retries slow deliveries, so acknowledge now and process after responding
+        background_tasks.add_task(process_event, event.aspect_type, event.owner_id, event.object_id)
 
         return {"status": "ok"}
 
     except Exception as e:
-        print(f"Webhook error: {str(e)}")
+        logger.error("Webhook error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
-async def process_new_activity(athlete_id: int, activity_id: int) -> None:
+async def process_event(aspect_type: str, athlete_id: int, activity_id: int) -> None:
+    """Run the pipeline for one webhook event; errors are reported here as the response is already sent."""
     try:
-        print(f"Fetching activity details for activity_id: {activity_id}")
-        
-        access_token = get_access_token(CLIENT_ID, CLIENT_SECRET, REFRESH_TOKEN)
-        
-        activity_data = fetch_single_activity(access_token, activity_id)
-        if not activity_data:
-            print(f"Failed to fetch activity {activity_id}")
-            return
-
-        df = pd.DataFrame([activity_data])
-        df_transformed = transform_data(df)
+        # Take the per-activity lock first so queued duplicates do not hold up other activities
+        async with activity_lock(activity_id), _process_semaphore:
+            if aspect_type == "create":
+                await process_new_activity(athlete_id, activity_id)
+            elif aspect_type == "update":
+                await process_updated_activity(athlete_id, activity_id)
+            elif aspect_type == "delete":
+                await delete_activity(activity_id)
+    except Exception:
+        logger.exception("Error handling %s event for activity %s", aspect_type, activity_id)
 
-        # Check if activity exists
-        result = supabase.table('activities').select("activity_id").eq('activity_id', activity_id).execute()
-        
-        if len(result.data) > 0:
-            print(f"Activity {activity_id} already exists. Skipping insertion.")
-            return
+async def process_new_activity(athlete_id: int, activity_id: int) -> None:
+    logger.info("Fetching activity details for activity_id: %s", activity_id)
+    
+    access_token = await get_cached_token()
+    
+    # The Strava client is blocking, so run it off the event loop
+    activity_data = await strava_limiter.run(
+        asyncio.to_thread(fetch_single_activity, access_token, activity_id),
+        is_failure=lambda data: data is None,
+    )
+    if not activity_data:
+        logger.warning("Failed to fetch activity %s", activity_id)
+        return
 
-        # Convert DataFrame to dict and prepare for Supabase
-        activity_dict = df_transformed.to_dict('records')[0]
-        processed_dict = prepare_for_supabase(activity_dict)
+    # A single record is transformed directly, without building a DataFrame
+    activity_dict = transform_record(activity_data)
 
-        # Insert new activity
-        result = supabase.table('activities').insert(processed_dict).execute()
+    # Insert new activity alongside any others arriving in the same window
+    if not await queue_insert(activity_dict):
+        logger.info("Activity %s already exists. Skipping insertion.", activity_id)
+        return
         
-        if not result.data:
-            print(f"Warning: No confirmation data received for activity {activity_id}")
-            return
-            
-        print(f"Stored activity {activity_id} in database.")
-
-    except Exception as e:
-        print(f"Error processing activity {activity_id}: {e}")
-        raise  # Re-raise the exception to see the full traceback
+    logger.info("Stored activity %s in database.", activity_id)
 
 async def process_updated_activity(athlete_id: int, activity_id: int) -> None:
-    try:
-        access_token = get_access_token(CLIENT_ID, CLIENT_SECRET, REFRESH_TOKEN)
-        
-        activity_data = fetch_single_activity(access_token, activity_id)
-        if not activity_data:
-            print(f"Failed to fetch updated activity {activity_id}")
-            return
+    access_token = await get_cached_token()
+    
+    # The Strava client is blocking, so run it off the event loop
+    activity_data = await strava_limiter.run(
+        asyncio.to_thread(fetch_single_activity, access_token, activity_id),
+        is_failure=lambda data: data is None,
+    )
+    if not activity_data:
+        logger.warning("Failed to fetch updated activity %s", activity_id)
+        return
 
-        df = pd.DataFrame([activity_data])
-        df_transformed = transform_data(df)
-        
-        # Convert DataFrame to dict and prepare for Supabase
-        activity_dict = df_transformed.to_dict('records')[0]
-        processed_dict = prepare_for_supabase(activity_dict)
+    # A single record is transformed directly, without building a DataFrame
+    activity_dict = transform_record(activity_data)
+    processed_dict = to_json_compatible(activity_dict)
 
-        # Update existing record
-        result = supabase.table('activities').update(processed_dict).eq('activity_id', activity_id).execute()
-        
-        if not result.data:
-            print(f"Warning: No confirmation data received for updating activity {activity_id}")
-            return
-            
-        print(f"Updated activity {activity_id} in database.")
+    supabase: AsyncClient = app.state.supabase
 
-    except Exception as e:
-        print(f"Error updating activity {activity_id}: {e}")
-        raise
+    # Update existing record
+    result = await _db(
+        supabase.table('activities').update(processed_dict).eq('activity_id', activity_id).execute()
+    )
+    
+    if not result.data:
+        logger.warning("No confirmation data received for updating activity %s", activity_id)
+        return
+        
+    logger.info("Updated activity %s in database.", activity_id)
 
 async def delete_activity(activity_id: int) -> None:
-    try:
-        result = supabase.table('activities').delete().eq('activity_id', activity_id).execute()
+    supabase: AsyncClient = app.state.supabase
+    result = await _db(
+        supabase.table('activities').delete().eq('activity_id', activity_id).execute()
+    )
+    
+    if not result.data:
+        logger.warning("No confirmation data received for deleting activity %s", activity_id)
+        return
         
-        if not result.data:
-            print(f"Warning: No confirmation data received for deleting activity {activity_id}")
-            return
-            
-        print(f"Deleted activity {activity_id} from database.")
-    except Exception as e:
-        print(f"Error deleting activity {activity_id}: {e}")
-        raise  # Re-raise the exception to see the full traceback
+    logger.info("Deleted activity %s from database.", activity_id)
 
 if __name__ == "__main__":
     # Use the PORT environment variable provided by Render